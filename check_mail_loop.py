@@ -45,10 +45,14 @@ import uuid
 import sys
 import os
 import ssl
+import re
+import select
+import socket
 import time
+import concurrent.futures
 from email.mime.text import MIMEText
 from enum import Enum
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 
 class MailFound(Enum):
@@ -58,16 +62,60 @@ class MailFound(Enum):
 	NOT_FOUND = 3
 
 
+class ResumingSMTP_SSL(smtplib.SMTP_SSL):
+	"""
+	SMTP_SSL connection that resumes a previous TLS session to the same server.
+	"""
+
+	def _get_socket(self, host, port, timeout):
+		new_socket = smtplib.SMTP._get_socket(self, host, port, timeout)
+		return self.context.wrap_socket(new_socket, server_hostname=self._host, session=tls_sessions.get((host, port)))
+
+
+class ResumingIMAP4_SSL(imaplib.IMAP4_SSL):
+	"""
+	IMAP4_SSL connection that resumes a previous TLS session to the same server.
+	"""
+
+	def _create_socket(self, *args):
+		sock = imaplib.IMAP4._create_socket(self, *args)
+		# IMAP is a sequence of short commands that each wait for a reply. Do not let Nagle's algorithm delay them.
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		return self.ssl_context.wrap_socket(sock, server_hostname=self.host,
+											session=tls_sessions.get((self.host, self.port)))
+
+
 # global flags
 debug_flag = False
 
 # time to wait
 delay = 10
 
+# TLS sessions of previous connections, indexed by (host, port)
+tls_sessions = {}
 
-def debug(message: str) -> None:
+# text of the test mail
+BODY_TEXT = ("Dear Mail Server,\n\n"
+			 "This is your friendly Mail Check. It’s time for your regularly scheduled health inspection. You’ve been "
+			 "delivering e-mails like a champ. I hope your overall health is at its best. Today I am writing you "
+			 "another e-mail.\n\n"
+			 "Please remember, a healthy server is a happy server. Regular maintenance keeps you from joining the "
+			 "ghostly ranks of \"former production systems.\" Think of updates as vitamins. They might taste bad now, "
+			 "but they prevent those \"critical condition\" messages that make sysadmins cry in the dark.\n\n"
+			 "Anyway, just checking in. Stay cool, keep those ports open (the safe ones), and remember: if you ever "
+			 "start to feel sluggish, I'm only one alert away. I will write to you again very soon.\n\n"
+			 "Warm regards,\n\n"
+			 "Your mail check plugin\n")
+
+# matches the test header within a header block
+TOKEN_RE = re.compile(rb"^X-Icinga-Test-Id:[ \t]*(\S+)", re.M | re.I)
+
+
+def debug(message: str, *args) -> None:
 	if debug_flag:
-		print(message)
+		# Raw bytes from the server are decoded here, so that callers do not have to do it in advance.
+		args = tuple(arg.decode(errors='replace') if isinstance(arg, bytes) else arg for arg in args)
+		print(message % args if args else message)
 
 
 def email_create_message(mail_from: str, mail_to: str, _uuid: str) -> MIMEText:
@@ -80,19 +128,7 @@ def email_create_message(mail_from: str, mail_to: str, _uuid: str) -> MIMEText:
 	@return Function returns a MIMEText object.
 	"""
 
-	text = ("Dear Mail Server,\n\n"
-			"This is your friendly Mail Check. It’s time for your regularly scheduled health inspection. You’ve been "
-			"delivering e-mails like a champ. I hope your overall health is at its best. Today I am writing you "
-			"another e-mail.\n\n"
-			"Please remember, a healthy server is a happy server. Regular maintenance keeps you from joining the "
-			"ghostly ranks of \"former production systems.\" Think of updates as vitamins. They might taste bad now, "
-			"but they prevent those \"critical condition\" messages that make sysadmins cry in the dark.\n\n"
-			"Anyway, just checking in. Stay cool, keep those ports open (the safe ones), and remember: if you ever "
-			"start to feel sluggish, I'm only one alert away. I will write to you again very soon.\n\n"
-			"Warm regards,\n\n"
-			"Your mail check plugin\n")
-
-	msg = MIMEText(text)
+	msg = MIMEText(BODY_TEXT)
 
 	msg["From"] = mail_from
 	msg["To"] = mail_to
@@ -102,7 +138,22 @@ def email_create_message(mail_from: str, mail_to: str, _uuid: str) -> MIMEText:
 	return msg
 
 
-def smtp_connect(smtp_host: str, smtp_port: int, smtp_user: str, smtp_pass: str) -> smtplib.SMTP:
+def create_ssl_context() -> ssl.SSLContext:
+	"""
+	Create the TLS context. It is shared by the SMTP and the IMAP connection, so that the trust store is only
+	loaded once and TLS sessions can be resumed.
+
+	@return Function returns a ssl.SSLContext object.
+	"""
+
+	context = ssl.create_default_context()
+	context.options &= ~ssl.OP_NO_TICKET
+
+	return context
+
+
+def smtp_connect(smtp_host: str, smtp_port: int, smtp_user: str, smtp_pass: str,
+				 ssl_context: ssl.SSLContext) -> smtplib.SMTP:
 	"""
 	Connect to an SMTPS server.
 
@@ -110,130 +161,475 @@ def smtp_connect(smtp_host: str, smtp_port: int, smtp_user: str, smtp_pass: str)
 	@param smtp_port: The SMTP server port. STARTSSL or plaintext communication is not supported.
 	@param smtp_user: The username for SMTP authentication.
 	@param smtp_pass: The password for SMTP authentication.
+	@param ssl_context: The TLS context for the connection.
 	@return Function returns a smtplib.SMTP object that represents a server connection.
 	"""
 
-	server = smtplib.SMTP_SSL(smtp_host, smtp_port, context=ssl.create_default_context())
-	debug(f"SMTP: Try to log in to {smtp_host} as: {smtp_user}")
+	server = ResumingSMTP_SSL(smtp_host, smtp_port, context=ssl_context)
+	debug("SMTP: Try to log in to %s as: %s", smtp_host, smtp_user)
 	server.login(smtp_user, smtp_pass)
-	debug(f"SMTP: Log in was successful.")
+	debug("SMTP: Log in was successful.")
+	tls_sessions[(smtp_host, smtp_port)] = server.sock.session
 
 	return server
 
 
-def imap_retrieve_mail(imap_host: str, imap_port: int, imap_user: str, imap_pass: str, imap_spambox: Optional[str],
-					   expected_token: str, cleanup_flag: bool) -> MailFound:
+def smtp_reuse(server: Optional[smtplib.SMTP]) -> Optional[smtplib.SMTP]:
 	"""
-	Retrieve an e-mail from an IMAP account. Search the INBOX and the Spambox for a specific token value.
-	Retry up to three times.
+	Check if an SMTP connection from a previous run is still alive.
+
+	@param server: A smtplib.SMTP object that represents a server connection or None.
+	@return Function returns the server connection or None, if it has to be re-established.
+	"""
+
+	if server is None:
+		return None
+
+	try:
+		code, _ = server.noop()
+		if code == 250:
+			return server
+	except (smtplib.SMTPException, OSError) as e:
+		debug("SMTP: Connection was lost: %s", e)
+
+	server.close()
+	return None
+
+
+def imap_connect(imap_host: str, imap_port: int, imap_user: str, imap_pass: str,
+				 ssl_context: ssl.SSLContext) -> imaplib.IMAP4:
+	"""
+	Connect to an IMAPS server.
 
 	@param imap_host: The mail server host.
-	@param imap_port: The SMTP server port. STARTSSL or plaintext communication is not supported.
-	@param imap_user: The username for SMTP authentication.
-	@param imap_pass: The password for SMTP authentication.
+	@param imap_port: The IMAP server port. STARTSSL or plaintext communication is not supported.
+	@param imap_user: The username for IMAP authentication.
+	@param imap_pass: The password for IMAP authentication.
+	@param ssl_context: The TLS context for the connection.
+	@return Function returns an imaplib.IMAP4 object that represents a server connection.
+	"""
+
+	server = ResumingIMAP4_SSL(host=imap_host, port=imap_port, ssl_context=ssl_context)
+	debug("IMAP: Try to log in to %s as: %s", imap_host, imap_user)
+	server.login(imap_user, imap_pass)
+	debug("IMAP: Log in was successful.")
+	tls_sessions[(imap_host, imap_port)] = server.sock.session
+
+	return server
+
+
+def imap_reuse(server: Optional[imaplib.IMAP4]) -> Optional[imaplib.IMAP4]:
+	"""
+	Check if an IMAP connection from a previous run is still alive.
+
+	@param server: An imaplib.IMAP4 object that represents a server connection or None.
+	@return Function returns the server connection or None, if it has to be re-established.
+	"""
+
+	if server is None:
+		return None
+
+	try:
+		typ, _ = server.noop()
+		if typ == "OK":
+			return server
+	except (imaplib.IMAP4.abort, OSError) as e:
+		debug("IMAP: Connection was lost: %s", e)
+
+	server.shutdown()
+	return None
+
+
+def imap_get_uid_next(server: imaplib.IMAP4, imap_spambox: Optional[str]) -> Dict[str, Optional[int]]:
+	"""
+	Lookup the UID that the next arriving mail will get in the INBOX and the Spambox. Call this before sending the
+	mail, so that the search can skip all mails that were there before.
+
+	@param server: An imaplib.IMAP4 object that represents the logged in sever connection.
+	@param imap_spambox: The name of the spam mailbox. Pass None to skip.
+	@return Function returns a dict that maps the mailbox name to the next UID or None if the server did not tell.
+	"""
+
+	uid_next = {}
+
+	for mailbox in ["INBOX", imap_spambox] if imap_spambox else ["INBOX"]:
+		typ, _ = server.select(mailbox, readonly=True)
+		if typ != "OK":
+			uid_next[mailbox] = None
+			continue
+		_, data = server.response('UIDNEXT')
+		uid_next[mailbox] = int(data[0]) if data[0] else None
+		debug("IMAP: Next UID in mailbox %s is %s.", mailbox, uid_next[mailbox])
+		server.close()
+
+	return uid_next
+
+
+def imap_retrieve_mail(server: imaplib.IMAP4, imap_spambox: Optional[str], expected_token: bytes,
+					   cleanup_flag: bool, uid_next: Dict[str, Optional[int]]) -> MailFound:
+	"""
+	Retrieve an e-mail from an IMAP account. Search the INBOX and the Spambox for a specific token value.
+	Retry up to four times with an exponential backoff. If the server supports IDLE, a new mail in the INBOX ends
+	the wait early. The Spambox is only searched if the mail is not in the INBOX. Mails are removed after the
+	search.
+
+	@param server: An imaplib.IMAP4 object that represents the logged in sever connection.
 	@param imap_spambox: The name of the spam mailbox, where the mail is also searched. Pass None to skip.
 	@param expected_token: Lookup this token in a X-Icinga-Test-Id E-mail header.
 	@param cleanup_flag: Remove mails from the IMAP account.
+	@param uid_next: Only search mails from this UID on, as returned by imap_get_uid_next().
 
 	@return Function returns a MailFound status.
 	"""
 
-	# Establish IMAP connection
-	server = imaplib.IMAP4_SSL(host=imap_host, port=imap_port, ssl_context=ssl.create_default_context())
-	debug(f"IMAP: Try to log in to {imap_host} as: {imap_user}")
-	server.login(imap_user, imap_pass)
-	debug(f"IMAP: Log in was successful.")
-
 	status = MailFound.NOT_FOUND
 
-	# Check which mailboxes to lookup. Start with the spam box (if enabled) to clean it up.
-	mailboxes = []
 	if imap_spambox:
-		debug(f"IMAP: Will also check spambox \"{imap_spambox}\".")
-		mailboxes.append(imap_spambox)
-	mailboxes.append("INBOX")
-
-	for i in range(0, 3):
+		debug("IMAP: Will also check spambox \"%s\".", imap_spambox)
+
+	use_idle = "IDLE" in server.capabilities
+	idle_uid_next = uid_next.get("INBOX")
+
+	for i in range(0, 4):
+
+		curr_delay = delay * 2 ** i
+		deadline = time.monotonic() + curr_delay
+		debug("IMAP: Waiting up to %s seconds for new mail.", curr_delay)
+
+		# A new mail that is not the test mail ends IDLE early. Keep waiting until the deadline of this attempt.
+		while True:
+			remaining = deadline - time.monotonic()
+			if remaining > 0 and use_idle:
+				new_mail, idle_uid_next = imap_idle(server, "INBOX", remaining, idle_uid_next)
+				if new_mail is None:
+					use_idle = False
+					continue
+			elif remaining > 0:
+				time.sleep(remaining)
+
+			# The spam box only needs to be searched if the mail is not in the INBOX.
+			status = imap_find_token(server, "INBOX", expected_token, uid_next.get("INBOX"))
+			if status == MailFound.NOT_FOUND and imap_spambox:
+				status = imap_find_token(server, imap_spambox, expected_token, uid_next.get(imap_spambox))
+
+			if status != MailFound.NOT_FOUND or time.monotonic() >= deadline:
+				break
 
-		curr_delay = delay * pow(i+1, 2)
-		if curr_delay > 0:
-			debug(f"IMAP: Waiting for {curr_delay} seconds.")
-			time.sleep(curr_delay)
+		if status != MailFound.NOT_FOUND:
+			break
 
-		for mailbox in mailboxes:
-			status = imap_search_server(server, mailbox, expected_token, cleanup_flag)
-			if status != MailFound.NOT_FOUND:
-				server.logout()
-				return status
+	if cleanup_flag:
+		imap_cleanup(server, "INBOX")
+		if imap_spambox:
+			imap_cleanup(server, imap_spambox)
 
-	server.logout()
 	return status
 
 
-def imap_search_server(server: imaplib.IMAP4, mailbox: str, expected_token: str, cleanup_flag: bool) -> MailFound:
+def imap_data_buffered(server: imaplib.IMAP4) -> bool:
+	"""
+	Check without blocking if a response can be read from the server. imaplib reads through a buffered file object,
+	so a response may already wait in its buffer while the socket itself has nothing left to read.
+
+	@param server: An imaplib.IMAP4 object that represents the logged in sever connection.
+	@return Function returns True if at least one byte can be read without blocking.
+	"""
+
+	timeout = server.sock.gettimeout()
+	server.sock.setblocking(False)
+	try:
+		return bool(server.file.peek(1))
+	except (ssl.SSLWantReadError, BlockingIOError):
+		return False
+	finally:
+		server.sock.settimeout(timeout)
+
+
+def imap_idle(server: imaplib.IMAP4, mailbox: str, timeout: float,
+			  uid_next: Optional[int]) -> Tuple[Optional[bool], Optional[int]]:
+	"""
+	Wait for a new mail in a mailbox with the IDLE command (RFC 2177). imaplib does not support IDLE, so the command
+	is sent and its responses are read directly.
+
+	@param server: An imaplib.IMAP4 object that represents the logged in sever connection.
+	@param mailbox: Name of the mailbox to watch, such as INBOX.
+	@param timeout: Wait at most this many seconds.
+	@param uid_next: The next UID of the mailbox at the last call or None. If the mailbox has moved past it, a mail
+		arrived in the meantime and the function returns without waiting.
+	@return Function returns True if the server reported a new mail, False on timeout and None if the server
+		rejected IDLE. The second value is the next UID of the mailbox when the wait started, to be passed to the
+		next call.
+	"""
+
+	def readline() -> bytes:
+		line = server.readline()
+		if not line:
+			raise imaplib.IMAP4.abort("socket error: EOF during IDLE")
+		return line
+
+	server.select(mailbox, readonly=True)
+
+	# A mail that arrived after the last search would not wake IDLE.
+	_, data = server.response('UIDNEXT')
+	curr_uid_next = int(data[0]) if data[0] else None
+	if uid_next and curr_uid_next and curr_uid_next > uid_next:
+		debug("IMAP: Mailbox %s got new mail before IDLE.", mailbox)
+		server.close()
+		return True, curr_uid_next
+
+	tag = server._new_tag()
+	del server.tagged_commands[tag]
+	server.send(tag + b" IDLE\r\n")
+
+	# Untagged responses may arrive before the server confirms IDLE. Only a tagged response rejects it.
+	new_mail = False
+	line = readline()
+	while not line.startswith(b"+"):
+		if line.startswith(tag):
+			debug("IMAP: IDLE was rejected: %s", line.strip())
+			server.close()
+			return None, curr_uid_next
+		new_mail = new_mail or line.rstrip().endswith(b"EXISTS")
+		line = readline()
+
+	deadline = time.monotonic() + timeout
+	while not new_mail:
+		remaining = deadline - time.monotonic()
+		if remaining <= 0:
+			break
+		if not imap_data_buffered(server):
+			readable, _, _ = select.select([server.sock], [], [], remaining)
+			if not readable:
+				break
+		line = readline()
+		new_mail = line.rstrip().endswith(b"EXISTS")
+
+	server.send(b"DONE\r\n")
+	while not line.startswith(tag):
+		line = readline()
+
+	debug("IMAP: IDLE on mailbox %s ended %s.", mailbox, 'with new mail' if new_mail else 'without new mail')
+	server.close()
+
+	return new_mail, curr_uid_next
+
+
+def imap_find_token(server: imaplib.IMAP4, mailbox: str, expected_token: bytes,
+					uid_next: Optional[int] = None) -> MailFound:
 	"""
 	Lookup token on IMAP server.
 
 	@param server: An imaplib.IMAP4 object that represents the sever connection.
 	@param mailbox: Name of the mailbox, such as INBOX or Junk.
 	@param expected_token: Lookup this token in a "X-Icinga-Test-Id" E-mail header.
-	@param cleanup_flag: Remove mails from the IMAP account.
+	@param uid_next: Only search mails with this UID or higher. Pass None to search the whole mailbox.
 	@return Function returns a MailFound status.
 	"""
 
-	class Email:
-		def __init__(self, _data):
-			self.data = _data.decode()
-			self.header = "\r\n\r\n".join(self.data.split("\r\n\r\n")[0:1])
-
 	token_found = MailFound.NOT_FOUND
-	token = ""
 
-	debug(f"IMAP: Check mail in mailbox {mailbox}.")
-	select_status, num_msg_in_mbox = server.select(mailbox)
+	debug("IMAP: Check mail in mailbox %s.", mailbox)
+	select_status, num_msg_in_mbox = server.select(mailbox, readonly=True)
 	num_msg_in_mbox = int(num_msg_in_mbox[0])
-	debug(f"IMAP: Mailbox selection status: {select_status}")
-	debug(f"IMAP: Mailbox {mailbox} contains {num_msg_in_mbox} messages.")
+	debug("IMAP: Mailbox selection status: %s", select_status)
+	debug("IMAP: Mailbox %s contains %s messages.", mailbox, num_msg_in_mbox)
+
+	# The SELECT response already tells if there is anything to search for.
+	_, data = server.response('UIDNEXT')
+	if num_msg_in_mbox == 0 or (uid_next and data[0] and int(data[0]) <= uid_next):
+		debug("IMAP: [%s] No new mails.", mailbox)
+		server.close()
+		return token_found
+
+	# Only the mails that arrived after sending have to be checked. Fetching their test header directly works on all
+	# servers, while some servers do not index custom headers for a SEARCH.
+	if uid_next:
+		token_found = imap_scan_headers(server, mailbox, expected_token, uid_next)
+	else:
+		# Let the server look for the header in the whole mailbox, so that no message data has to be transferred.
+		# Only if the server rejects the search, the headers are fetched and scanned instead.
+		try:
+			typ, data_match = server.search(None, 'HEADER', 'X-Icinga-Test-Id', b'"' + expected_token + b'"')
+		except imaplib.IMAP4.abort:
+			raise
+		except imaplib.IMAP4.error as e:
+			debug("IMAP: [%s] Header search is not supported: %s", mailbox, e)
+			typ, data_match = "BAD", []
+
+		if typ != "OK":
+			token_found = imap_scan_headers(server, mailbox, expected_token)
+		elif data_match[0]:
+			debug("IMAP: [%s] Expected token %s found in %s.", mailbox, expected_token, mailbox)
+			token_found = MailFound.FOUND if mailbox == "INBOX" else MailFound.FOUND_IN_SPAM
+
+	if token_found == MailFound.UNDEFINED:
+		return token_found
+
+	server.close()
+
+	return token_found
+
+
+def imap_cleanup(server: imaplib.IMAP4, mailbox: str) -> None:
+	"""
+	Remove all mails from a mailbox.
+
+	@param server: An imaplib.IMAP4 object that represents the sever connection.
+	@param mailbox: Name of the mailbox, such as INBOX or Junk.
+	"""
+
+	_, num_msg_in_mbox = server.select(mailbox)
+	num_msg_in_mbox = int(num_msg_in_mbox[0])
+
+	# All mails are removed, so there is no need to enumerate them. The message set 1:* covers the whole mailbox.
+	if num_msg_in_mbox > 0:
+		debug("IMAP: [%s] Mark %s mails as deleted.", mailbox, num_msg_in_mbox)
+		server.store("1:*", '+FLAGS', '\\Deleted')
+		server.expunge()
+	server.close()
+
+
+def imap_scan_headers(server: imaplib.IMAP4, mailbox: str, expected_token: bytes,
+					  uid_next: Optional[int] = None) -> MailFound:
+	"""
+	Lookup token by fetching the "X-Icinga-Test-Id" header of the mails in the selected mailbox.
+
+	@param server: An imaplib.IMAP4 object that represents the sever connection.
+	@param mailbox: Name of the selected mailbox, such as INBOX or Junk.
+	@param expected_token: Lookup this token in a "X-Icinga-Test-Id" E-mail header.
+	@param uid_next: Only fetch mails with this UID or higher. Pass None to fetch all mails.
+	@return Function returns a MailFound status.
+	"""
 
-	typ, data_mlist = server.search(None, 'ALL')
+	# Fetch the test header of all messages in a single round-trip. BODY.PEEK does not set the \Seen flag.
+	if uid_next:
+		typ, data_mail = server.uid('FETCH', f'{uid_next}:*', "(BODY.PEEK[HEADER.FIELDS (X-Icinga-Test-Id)])")
+	else:
+		typ, data_mail = server.fetch("1:*", "(BODY.PEEK[HEADER.FIELDS (X-Icinga-Test-Id)])")
 
 	if typ != "OK":
 		return MailFound.UNDEFINED
 
-	for num in data_mlist[0].split():
+	# The response alternates between (envelope, header) tuples and closing b')' items.
+	for item in data_mail:
 
-		num_str = num.decode('utf-8')
+		if not isinstance(item, tuple):
+			continue
 
-		if token_found == MailFound.NOT_FOUND:
+		# The payload is just the requested header field, so it can be matched without looking for the body.
+		m = TOKEN_RE.search(item[1])
+		found = m is not None and m.group(1) == expected_token
 
-			typ, data_mail = server.fetch(num_str, '(RFC822)')
-			debug(f"IMAP: [{mailbox}]:{num_str} Check mail {num_str}.")
-			email = Email(data_mail[0][1])
-			for line in email.header.splitlines():
+		# The message number is only needed for the debug output.
+		if debug_flag:
+			num = item[0].split(None, 1)[0]
+			debug("IMAP: [%s]:%s Check mail %s.", mailbox, num, num)
+			if m:
+				debug("IMAP: [%s]:%s A token was found: %s", mailbox, num, m.group(1))
+			if found:
+				debug("IMAP: [%s]:%s Expected token %s found in %s.", mailbox, num, expected_token, mailbox)
+			else:
+				debug("IMAP: [%s]:%s Expected token was not found in this e-mail.", mailbox, num)
 
-				if line.startswith("X-Icinga-Test-Id"):
-					token = line.split("X-Icinga-Test-Id: ")[1].strip()
-					debug(f"IMAP: [{mailbox}]:{num_str} A token was found: {token}")
+		if found:
+			return MailFound.FOUND if mailbox == "INBOX" else MailFound.FOUND_IN_SPAM
 
-			if token == expected_token:
-				debug(f"IMAP: [{mailbox}]:{num_str} Expected token {token} found in {mailbox}.")
-				if mailbox == "INBOX":
-					token_found = MailFound.FOUND
-				else:
-					token_found = MailFound.FOUND_IN_SPAM
-				break
-			else:
-				debug(f"IMAP: [{mailbox}]:{num_str} Expected token was not found in this e-mail.")
+	return MailFound.NOT_FOUND
 
-		if cleanup_flag:
-			debug(f"IMAP: [{mailbox}]:{num_str} Mark mail {num_str} as deleted.")
-			server.store(num, '+FLAGS', '\\Deleted')
 
-	if cleanup_flag:
-		server.expunge()
-	server.close()
+def close_connections(smtp_server: Optional[smtplib.SMTP], imap_server: Optional[imaplib.IMAP4]) -> None:
+	"""
+	Close the SMTP and IMAP connections. Errors of connections that are already broken are ignored.
 
-	return token_found
+	@param smtp_server: A smtplib.SMTP object that represents a server connection or None.
+	@param imap_server: An imaplib.IMAP4 object that represents a server connection or None.
+	"""
+
+	if smtp_server is not None:
+		try:
+			smtp_server.quit()
+		except (smtplib.SMTPException, OSError):
+			smtp_server.close()
+
+	if imap_server is not None:
+		try:
+			# logout() shuts the connection down, even if the server does not answer.
+			imap_server.logout()
+		except OSError:
+			pass
+
+
+def run_check(args: argparse.Namespace, ssl_context: ssl.SSLContext, email: MIMEText,
+			  smtp_server: Optional[smtplib.SMTP],
+			  imap_server: Optional[imaplib.IMAP4]) -> Tuple[MailFound, Optional[smtplib.SMTP], imaplib.IMAP4]:
+	"""
+	Send a test mail and look it up on the IMAP server.
+
+	@param args: The parsed command line arguments.
+	@param ssl_context: The TLS context for the connections.
+	@param email: The mail to send, as created by email_create_message(). Its X-Icinga-Test-Id is replaced.
+	@param smtp_server: The SMTP connection of a previous run or None.
+	@param imap_server: The IMAP connection of a previous run or None.
+	@return Function returns the MailFound status and the SMTP and IMAP connections for the next run. Without
+		--daemon, the SMTP connection is closed after sending and None is returned instead.
+	"""
+
+	# The header needs the UUID as str, the IMAP lookups compare it as bytes.
+	_uuid = str(uuid.uuid4())
+	_uuid_b = _uuid.encode('ascii')
+	email.replace_header("X-Icinga-Test-Id", _uuid)
+
+	def imap_prepare():
+		# Assign the connection right away, so that it can be closed if the check fails later on.
+		nonlocal imap_server
+		imap_server = imap_reuse(imap_server) or imap_connect(args.imap_host, args.imap_port, args.imap_user,
+															  args.imap_pass, ssl_context)
+		return imap_get_uid_next(imap_server, args.imap_spam)
+
+	try:
+		# Log in to the IMAP server while connecting to the SMTP server. The next UIDs must be known before sending.
+		with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+			imap_future = executor.submit(imap_prepare)
+			smtp_server = smtp_reuse(smtp_server) or smtp_connect(args.smtp_host, args.smtp_port, args.smtp_user,
+																  args.smtp_pass, ssl_context)
+			uid_next = imap_future.result()
+			smtp_server.send_message(email, from_addr=args.mail_from, to_addrs=[args.mail_to])
+			debug("SMTP: Sent e-mail with ID %s to %s.", _uuid, args.mail_to)
+
+			# A single check does not need the SMTP connection anymore. The server may drop it while waiting for
+			# the mail.
+			if not args.daemon:
+				close_connections(smtp_server, None)
+				smtp_server = None
+
+		status = imap_retrieve_mail(imap_server, args.imap_spam, _uuid_b, args.imap_cleanup, uid_next)
+	except Exception:
+		close_connections(smtp_server, imap_server)
+		raise
+
+	return status, smtp_server, imap_server
+
+
+def report_status(status: MailFound) -> int:
+	"""
+	Print the check result.
+
+	@param status: The MailFound status of a check.
+	@return Function returns the plugin exit code.
+	"""
+
+	if status == MailFound.FOUND:
+		print("OK")
+		return 0
+	elif status == MailFound.FOUND_IN_SPAM:
+		print("WARNING - Message found in Spam folder")
+		return 1
+	elif status == MailFound.NOT_FOUND:
+		print("ERROR - Message not found")
+		return 2
+	else:
+		print("UNDEFINED - Undefined state")
+		return 3
 
 
 def main():
@@ -267,32 +663,39 @@ def main():
 
 	parser.add_argument('--delay', metavar='SECONDS', help=f"Delay between sending and retrieving (default {delay} s).",
 						type=int, default=delay)
+
+	parser.add_argument('--daemon', action='store_true',
+						help="Repeat the check forever and keep the SMTP and IMAP connections open in between.")
+	parser.add_argument('--interval', metavar='SECONDS', help="Daemon: Time between two checks (default 300 s).",
+						type=int, default=300)
 	args = parser.parse_args()
 
 	debug_flag = args.debug
 	delay = args.delay
 
-	_uuid = str(uuid.uuid4())
-	email = email_create_message(args.mail_from, args.mail_to, _uuid)
-	smtp_server = smtp_connect(args.smtp_host, args.smtp_port, args.smtp_user, args.smtp_pass)
-	smtp_server.sendmail(args.mail_from, args.mail_to, email.as_string())
-	debug(f"SMTP: Sent e-mail with ID {_uuid} to {args.mail_to}.")
-
-	status = imap_retrieve_mail(args.imap_host, args.imap_port, args.imap_user, args.imap_pass, args.imap_spam, _uuid,
-								args.imap_cleanup)
-
-	if status == MailFound.FOUND:
-		print("OK")
-		return 0
-	elif status == MailFound.FOUND_IN_SPAM:
-		debug("WARNING - Message found in Spam folder")
-		return 1
-	elif status == MailFound.NOT_FOUND:
-		print("ERROR - Message not found")
-		return 2
-	else:
-		print("UNDEFINED - Undefined state")
-		return 3
+	ssl_context = create_ssl_context()
+	email = email_create_message(args.mail_from, args.mail_to, "")
+
+	if not args.daemon:
+		status, smtp_server, imap_server = run_check(args, ssl_context, email, None, None)
+		close_connections(smtp_server, imap_server)
+		return report_status(status)
+
+	# Print each result immediately, even if the output is redirected.
+	sys.stdout.reconfigure(line_buffering=True)
+
+	smtp_server = None
+	imap_server = None
+	while True:
+		try:
+			status, smtp_server, imap_server = run_check(args, ssl_context, email, smtp_server, imap_server)
+		except Exception as e:
+			# run_check() has closed the connections already. Keep the daemon running and report the failure.
+			print("UNDEFINED - Check failed: %s" % e)
+			smtp_server, imap_server = None, None
+		else:
+			report_status(status)
+		time.sleep(args.interval)
 
 
 if __name__ == "__main__":